@@ -18,20 +18,26 @@ Templates can also include conditional logic and loops. Often used for web pages
 
 """
 
+# pylint: disable=too-many-lines
+
 __version__ = "0.0.0+auto.0"
 __repo__ = "https://github.com/adafruit/Adafruit_CircuitPython_TemplateEngine.git"
 
 try:
-    from typing import Any, Generator
+    from typing import Any, Callable, Generator
 except ImportError:
     pass
 
+from collections import OrderedDict
 import os
 import re
 
 try:
     from sys import implementation
 
+    # Interpreters for microcontrollers, with limited memory and some CPython features missing
+    _RUNNING_ON_MICROPYTHON = implementation.name in ("circuitpython", "micropython")
+
     if implementation.name == "circuitpython" and implementation.version < (9, 0, 0):
         print(
             "Warning: adafruit_templateengine requires CircuitPython 9.0.0, as previous versions"
@@ -52,6 +58,13 @@ class Token:  # pylint: disable=too-few-public-methods
 
         self.content = template[start_position:end_position]
 
+        self.is_expression = self.content.startswith(r"{{ ")
+        self.is_statement = self.content.startswith(r"{% ")
+
+        # Content without the delimiters, e.g. "if x" for "{% if x %}"
+        self.body = self.content[3:-3]
+        self.keyword = self.body.split(" ", 1)[0] if self.is_statement else None
+
 
 class TemplateNotFoundError(OSError):
     """Raised when a template file is not found."""
@@ -66,7 +79,20 @@ class TemplateSyntaxError(SyntaxError):
 
     def __init__(self, token: Token, reason: str):
         """Provided token is not a valid template syntax at the specified position."""
-        super().__init__(self._underline_token_in_template(token) + f"\n\n{reason}")
+        self._token = token
+        self._reason = reason
+
+        # Formatting the message is deferred until it is actually needed, except on CircuitPython,
+        # which prints uncaught exceptions using their arguments, without calling __str__
+        super().__init__(self.msg if _RUNNING_ON_MICROPYTHON else reason)
+
+    @property
+    def msg(self) -> str:
+        """Message with the underlined token and the reason of the error."""
+        return self._underline_token_in_template(self._token) + f"\n\n{self._reason}"
+
+    def __str__(self) -> str:
+        return self.msg
 
     @staticmethod
     def _skipped_lines_message(nr_of_lines: int) -> str:
@@ -91,61 +117,97 @@ class TemplateSyntaxError(SyntaxError):
         [5 lines skipped]
         ```
         """
+        template = token.template
+
+        line_start = template.rfind("\n", 0, token.start_position) + 1
+        line_end = template.find("\n", token.end_position)
+        if line_end == -1:
+            line_end = len(template)
+
+        lines_before_line_with_token = template[:line_start].split("\n")[:-1]
+        if 0 < (top_skipped_lines := len(lines_before_line_with_token) - lines_around):
+            lines_before_line_with_token = [
+                cls._skipped_lines_message(top_skipped_lines),
+                *lines_before_line_with_token[top_skipped_lines:],
+            ]
 
-        template_before_token = token.template[: token.start_position]
-        if top_skipped_lines := template_before_token.count("\n") - lines_around:
-            template_before_token = "\n".join(
-                template_before_token.split("\n")[-(lines_around + 1) :]
-            )
-
-            if 0 < top_skipped_lines:
-                top_skipped_lines_message = cls._skipped_lines_message(
-                    top_skipped_lines
-                )
-                template_before_token = (
-                    f"{top_skipped_lines_message}\n{template_before_token}"
-                )
-
-        template_after_token = token.template[token.end_position :]
-        if bottom_skipped_lines := template_after_token.count("\n") - lines_around:
-            template_after_token = "\n".join(
-                template_after_token.split("\n")[: (lines_around + 1)]
-            )
-
-            if 0 < bottom_skipped_lines:
-                bottom_skipped_lines_message = cls._skipped_lines_message(
-                    bottom_skipped_lines
-                )
-                template_after_token = (
-                    f"{template_after_token}\n{bottom_skipped_lines_message}"
-                )
-
-        lines_before_line_with_token = template_before_token.rsplit("\n", 1)[0]
-
-        line_with_token = (
-            template_before_token.rsplit("\n", 1)[-1]
-            + token.content
-            + template_after_token.split("\n")[0]
+        lines_after_line_with_token = (
+            template[line_end + 1 :].split("\n") if line_end < len(template) else []
         )
+        if 0 < (
+            bottom_skipped_lines := len(lines_after_line_with_token) - lines_around
+        ):
+            lines_after_line_with_token = [
+                *lines_after_line_with_token[:lines_around],
+                cls._skipped_lines_message(bottom_skipped_lines),
+            ]
+
+        line_with_token = template[line_start:line_end]
 
         line_with_underline = (
-            " " * len(template_before_token.rsplit("\n", 1)[-1])
+            " " * (token.start_position - line_start)
             + symbol * len(token.content)
-            + " " * len(template_after_token.split("\n")[0])
+            + " " * (line_end - token.end_position)
         )
 
-        lines_after_line_with_token = template_after_token.split("\n", 1)[-1]
-
         return "\n" + "\n".join(
             [
-                lines_before_line_with_token,
+                "\n".join(lines_before_line_with_token),
                 line_with_token,
                 line_with_underline,
-                lines_after_line_with_token,
+                "\n".join(lines_after_line_with_token),
             ]
         )
 
 
+_HTML_ENTITIES = {
+    "&": "&amp;",
+    ";": "&semi;",
+    '"': "&quot;",
+    "_": "&lowbar;",
+    "-": "&minus;",
+    ",": "&comma;",
+    ":": "&colon;",
+    "!": "&excl;",
+    "?": "&quest;",
+    ".": "&period;",
+    "'": "&apos;",
+    "(": "&lpar;",
+    ")": "&rpar;",
+    "[": "&lsqb;",
+    "]": "&rsqb;",
+    "{": "&lcub;",
+    "}": "&rcub;",
+    "@": "&commat;",
+    "*": "&ast;",
+    "/": "&sol;",
+    "\\": "&bsol;",
+    "#": "&num;",
+    "%": "&percnt;",
+    "`": "&grave;",
+    "^": "&Hat;",
+    "+": "&plus;",
+    "<": "&lt;",
+    "=": "&equals;",
+    ">": "&gt;",
+    "|": "&vert;",
+    "~": "&tilde;",
+    "$": "&dollar;",
+}
+
+try:
+    _HTML_TRANSLATION_TABLE = str.maketrans(_HTML_ENTITIES)
+except AttributeError:
+    # CircuitPython does not implement str.translate, a regex substitution is used instead
+    _HTML_TRANSLATION_TABLE = None
+
+_HTML_UNSAFE_SYMBOL_PATTERN = re.compile(r"[&;\"_\-,:!?.'()\[\]{}@*/\\#%`^+<=>|~$]")
+
+
+def _replace_with_html_entity(match: re.Match) -> str:
+    return _HTML_ENTITIES[match.group(0)]
+
+
 def safe_html(value: Any) -> str:
     """
     Encodes unsafe symbols in ``value`` to HTML entities and returns the string that can be safely
@@ -160,136 +222,214 @@ def safe_html(value: Any) -> str:
         # 1e&minus;10
     """
 
-    def _replace_amp_or_semi(match: re.Match):
-        return "&amp;" if match.group(0) == "&" else "&semi;"
+    value = str(value)
 
-    return (
-        # Replace initial & and ; together
-        re.sub(r"&|;", _replace_amp_or_semi, str(value))
-        # Replace other characters
-        .replace('"', "&quot;")
-        .replace("_", "&lowbar;")
-        .replace("-", "&minus;")
-        .replace(",", "&comma;")
-        .replace(":", "&colon;")
-        .replace("!", "&excl;")
-        .replace("?", "&quest;")
-        .replace(".", "&period;")
-        .replace("'", "&apos;")
-        .replace("(", "&lpar;")
-        .replace(")", "&rpar;")
-        .replace("[", "&lsqb;")
-        .replace("]", "&rsqb;")
-        .replace("{", "&lcub;")
-        .replace("}", "&rcub;")
-        .replace("@", "&commat;")
-        .replace("*", "&ast;")
-        .replace("/", "&sol;")
-        .replace("\\", "&bsol;")
-        .replace("#", "&num;")
-        .replace("%", "&percnt;")
-        .replace("`", "&grave;")
-        .replace("^", "&Hat;")
-        .replace("+", "&plus;")
-        .replace("<", "&lt;")
-        .replace("=", "&equals;")
-        .replace(">", "&gt;")
-        .replace("|", "&vert;")
-        .replace("~", "&tilde;")
-        .replace("$", "&dollar;")
+    # Most values do not contain any unsafe symbols, so they can be returned as they are
+    if _HTML_UNSAFE_SYMBOL_PATTERN.search(value) is None:
+        return value
+
+    # Replace all unsafe symbols in a single pass
+    if _HTML_TRANSLATION_TABLE is not None:
+        return value.translate(_HTML_TRANSLATION_TABLE)
+
+    return _HTML_UNSAFE_SYMBOL_PATTERN.sub(_replace_with_html_entity, value)
+
+
+# Escaping is inlined into the template functions to avoid calling safe_html for every expression
+if _HTML_TRANSLATION_TABLE is not None:
+    _SAFE_HTML_EXPRESSION = (
+        "__value if _find_unsafe_html_symbol(__value := str({})) is None"
+        " else __value.translate(_HTML_TRANSLATION_TABLE)"
     )
+else:
+    _SAFE_HTML_EXPRESSION = "safe_html({})"
 
 
-_EXTENDS_PATTERN = re.compile(r"{% extends '.+?' %}|{% extends \".+?\" %}")
+_EXTENDS_PATTERN = re.compile(r"{% extends ['\"](.+?)['\"] %}")
 _BLOCK_PATTERN = re.compile(r"{% block \w+? %}")
-_INCLUDE_PATTERN = re.compile(r"{% include '.+?' %}|{% include \".+?\" %}")
+_INCLUDE_PATTERN = re.compile(r"{% include ['\"](.+?)['\"] %}")
 _HASH_COMMENT_PATTERN = re.compile(r"{# .+? #}")
 _BLOCK_COMMENT_PATTERN = re.compile(
     r"{% comment ('.*?' |\".*?\" )?%}[\s\S]*?{% endcomment %}"
 )
+_NON_WHITESPACE_PATTERN = re.compile(r"\S+")
 _TOKEN_PATTERN = re.compile(r"{{ .+? }}|{% .+? %}")
-_LSTRIP_BLOCK_PATTERN = re.compile(r"\n +$")
-_YIELD_PATTERN = re.compile(r"\n +yield ")
 
 
-def _find_extends(template: str):
-    return _EXTENDS_PATTERN.search(template)
+def _find_extends(template: str, offset: int = 0):
+    return _EXTENDS_PATTERN.search(template, offset)
 
 
-def _find_block(template: str):
-    return _BLOCK_PATTERN.search(template)
+def _find_block(template: str, offset: int = 0):
+    return _BLOCK_PATTERN.search(template, offset)
 
 
-def _find_any_non_whitespace(template: str):
-    return re.search(r"\S+", template)
+def _find_any_non_whitespace(template: str, offset: int = 0, end_offset: int = None):
+    return _NON_WHITESPACE_PATTERN.search(
+        template, offset, len(template) if end_offset is None else end_offset
+    )
 
 
-def _find_endblock(template: str, name: str = r"\w+?"):
-    return re.search(r"{% endblock " + name + r" %}", template)
+def _find_endblock(
+    template: str, name: str, offset: int = 0
+) -> "tuple[int, int] | None":
+    # Block names contain only word characters, so no regex is needed to find the endblock
+    endblock = r"{% endblock " + name + r" %}"
 
+    if (endblock_start := template.find(endblock, offset)) == -1:
+        return None
 
-def _find_include(template: str):
-    return _INCLUDE_PATTERN.search(template)
+    return endblock_start, endblock_start + len(endblock)
 
 
-def _find_hash_comment(template: str):
-    return _HASH_COMMENT_PATTERN.search(template)
+def _find_include(template: str, offset: int = 0):
+    return _INCLUDE_PATTERN.search(template, offset)
 
 
-def _find_block_comment(template: str):
-    return _BLOCK_COMMENT_PATTERN.search(template)
+def _find_hash_comment(template: str, offset: int = 0):
+    return _HASH_COMMENT_PATTERN.search(template, offset)
 
 
-def _find_token(template: str):
-    return _TOKEN_PATTERN.search(template)
+def _find_block_comment(template: str, offset: int = 0):
+    return _BLOCK_COMMENT_PATTERN.search(template, offset)
+
+
+def _find_token(template: str, offset: int = 0):
+    return _TOKEN_PATTERN.search(template, offset)
 
 
 def _token_is_on_own_line(text_before_token: str) -> bool:
-    return _LSTRIP_BLOCK_PATTERN.search(text_before_token) is not None
+    # Equivalent of matching r"\n +$", without the regex overhead
+    text_without_trailing_spaces = text_before_token.rstrip(" ")
+
+    if len(text_without_trailing_spaces) == len(text_before_token):
+        return False
+
+    return text_without_trailing_spaces.endswith("\n")
 
 
-def _contains_any_yield_statement(function_def: str) -> bool:
-    return _YIELD_PATTERN.search(function_def) is not None
+def _size_and_modification_time(path_stat: "tuple") -> "tuple[int, int]":
+    # CircuitPython returns a plain tuple, with the modification time in whole seconds
+    return path_stat[6], getattr(path_stat, "st_mtime_ns", path_stat[8])
 
 
-def _exists_and_is_file(path: str) -> bool:
+def _read_template_file(
+    path: str, template_files: "dict[str, tuple[int, int]]" = None
+) -> str:
     try:
-        return (os.stat(path)[0] & 0b_11110000_00000000) == 0b_10000000_00000000
+        path_stat = os.stat(path)
     except OSError:
-        return False
+        path_stat = None
 
+    if (
+        path_stat is None
+        or (path_stat[0] & 0b_11110000_00000000) != 0b_10000000_00000000
+    ):
+        raise TemplateNotFoundError(path)
 
-def _resolve_includes(template: str):
-    while (include_match := _find_include(template)) is not None:
-        template_path = include_match.group(0)[12:-4]
+    # Save size and modification time, used for checking if cached template is outdated
+    if template_files is not None:
+        template_files[path] = _size_and_modification_time(path_stat)
 
-        # TODO: Restrict include to specific directory
+    # Reading the whole file at once skips the buffered text I/O layers
+    try:
+        file_descriptor = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    except AttributeError:
+        # CircuitPython does not provide low-level file operations
+        with open(path, "rb") as template_file:
+            return template_file.read().decode("utf-8")
 
-        if not _exists_and_is_file(template_path):
-            raise TemplateNotFoundError(template_path)
+    try:
+        template_bytes = os.read(file_descriptor, path_stat[6])
+
+        # A single read can return fewer bytes than requested
+        while len(template_bytes) < path_stat[6]:
+            if not (
+                remaining_bytes := os.read(
+                    file_descriptor, path_stat[6] - len(template_bytes)
+                )
+            ):
+                break
+
+            template_bytes += remaining_bytes
+    finally:
+        os.close(file_descriptor)
+
+    template = template_bytes.decode("utf-8")
+
+    # Translate newlines the same way as reading in text mode does
+    if "\r" in template:
+        template = template.replace("\r\n", "\n").replace("\r", "\n")
+
+    return template
+
+
+def _template_files_changed(template_files: "dict[str, tuple[int, int]]") -> bool:
+    for path, size_and_modification_time in template_files.items():
+        try:
+            path_stat = os.stat(path)
+        except OSError:
+            return True
+
+        if _size_and_modification_time(path_stat) != size_and_modification_time:
+            return True
+
+    return False
+
+
+def _add_to_limited_cache(cache: dict, key: Any, value: Any, limit: int) -> None:
+    # Remove the oldest entries when the cache is full, to limit the memory used by it
+    if key not in cache:
+        while cache and limit <= len(cache):
+            del cache[next(iter(cache))]
+
+    # Limit of zero or less disables the cache
+    if 0 < limit:
+        cache[key] = value
+
+
+def _resolve_includes(
+    template: str, template_files: "dict[str, tuple[int, int]]" = None
+):
+    # Included templates can contain includes themselves, so repeat until none are left
+    while _find_include(template) is not None:
+        template_parts: "list[str]" = []
+        offset = 0
+
+        while (include_match := _find_include(template, offset)) is not None:
+            template_path = include_match.group(1)
+
+            # TODO: Restrict include to specific directory
+
+            # Replace the include with the template content
+            template_parts.append(template[offset : include_match.start()])
+            template_parts.append(_read_template_file(template_path, template_files))
+
+            offset = include_match.end()
+
+        template_parts.append(template[offset:])
+        template = "".join(template_parts)
 
-        # Replace the include with the template content
-        with open(template_path, "rt", encoding="utf-8") as template_file:
-            template = (
-                template[: include_match.start()]
-                + template_file.read()
-                + template[include_match.end() :]
-            )
     return template
 
 
 def _resolve_includes_blocks_and_extends(  # pylint: disable=,too-many-locals
-    template: str,
+    template: str, template_files: "dict[str, tuple[int, int]]" = None
 ):
+    # Skip the searches when there is nothing to resolve
+    if (
+        "{% extends " not in template
+        and "{% include " not in template
+        and "{% block " not in template
+    ):
+        return template
+
     extended_templates: "set[str]" = set()
     block_replacements: "dict[str, str]" = {}
 
     # Processing nested child templates
     while (extends_match := _find_extends(template)) is not None:
-        extended_template_path = extends_match.group(0)[12:-4]
-
-        if not _exists_and_is_file(extended_template_path):
-            raise TemplateNotFoundError(extended_template_path)
+        extended_template_path = extends_match.group(1)
 
         # Check for circular extends
         if extended_template_path in extended_templates:
@@ -303,66 +443,64 @@ def _resolve_includes_blocks_and_extends(  # pylint: disable=,too-many-locals
             )
 
         # Load extended template
+        extended_template = _read_template_file(extended_template_path, template_files)
         extended_templates.add(extended_template_path)
-        with open(
-            extended_template_path, "rt", encoding="utf-8"
-        ) as extended_template_file:
-            extended_template = extended_template_file.read()
 
         offset = extends_match.end()
 
         # Resolve includes
-        template = _resolve_includes(template)
+        template = _resolve_includes(template, template_files)
 
         # Check for any stacked extends
-        if stacked_extends_match := _find_extends(template[extends_match.end() :]):
+        if stacked_extends_match := _find_extends(template, extends_match.end()):
             raise TemplateSyntaxError(
                 Token(
                     template,
-                    extends_match.end() + stacked_extends_match.start(),
-                    extends_match.end() + stacked_extends_match.end(),
+                    stacked_extends_match.start(),
+                    stacked_extends_match.end(),
                 ),
                 "Incorrect use of {% extends ... %}",
             )
 
         # Save block replacements
-        while (block_match := _find_block(template[offset:])) is not None:
+        while (block_match := _find_block(template, offset)) is not None:
             block_name = block_match.group(0)[9:-3]
 
             # Check for anything between blocks
             if content_between_blocks := _find_any_non_whitespace(
-                template[offset : offset + block_match.start()]
+                template, offset, block_match.start()
             ):
                 raise TemplateSyntaxError(
                     Token(
                         template,
-                        offset + content_between_blocks.start(),
-                        offset + content_between_blocks.end(),
+                        content_between_blocks.start(),
+                        content_between_blocks.end(),
                     ),
                     "Content outside block",
                 )
 
-            if not (endblock_match := _find_endblock(template[offset:], block_name)):
+            if (
+                endblock_span := _find_endblock(template, block_name, block_match.end())
+            ) is None:
                 raise TemplateSyntaxError(
                     Token(
                         template,
-                        offset + block_match.start(),
-                        offset + block_match.end(),
+                        block_match.start(),
+                        block_match.end(),
                     ),
                     "No matching {% endblock %}",
                 )
 
-            block_content = template[
-                offset + block_match.end() : offset + endblock_match.start()
-            ]
+            endblock_start, endblock_end = endblock_span
+            block_content = template[block_match.end() : endblock_start]
 
             # Check for unsupported nested blocks
             if (nested_block_match := _find_block(block_content)) is not None:
                 raise TemplateSyntaxError(
                     Token(
                         template,
-                        offset + block_match.end() + nested_block_match.start(),
-                        offset + block_match.end() + nested_block_match.end(),
+                        block_match.end() + nested_block_match.start(),
+                        block_match.end() + nested_block_match.end(),
                     ),
                     "Nested blocks are not supported",
                 )
@@ -374,14 +512,14 @@ def _resolve_includes_blocks_and_extends(  # pylint: disable=,too-many-locals
             else:
                 block_replacements.setdefault(block_name, block_content)
 
-            offset += endblock_match.end()
+            offset = endblock_end
 
-        if content_after_last_endblock := _find_any_non_whitespace(template[offset:]):
+        if content_after_last_endblock := _find_any_non_whitespace(template, offset):
             raise TemplateSyntaxError(
                 Token(
                     template,
-                    offset + content_after_last_endblock.start(),
-                    offset + content_after_last_endblock.end(),
+                    content_after_last_endblock.start(),
+                    content_after_last_endblock.end(),
                 ),
                 "Content outside block",
             )
@@ -389,29 +527,33 @@ def _resolve_includes_blocks_and_extends(  # pylint: disable=,too-many-locals
         template = extended_template
 
     # Resolve includes in top-level template
-    template = _resolve_includes(template)
+    template = _resolve_includes(template, template_files)
 
     return _replace_blocks_with_replacements(template, block_replacements)
 
 
 def _replace_blocks_with_replacements(template: str, replacements: "dict[str, str]"):
+    template_parts: "list[str]" = []
+    offset = 0
+
     # Replace blocks in top-level template
-    while (block_match := _find_block(template)) is not None:
+    while (block_match := _find_block(template, offset)) is not None:
         block_name = block_match.group(0)[9:-3]
 
+        template_parts.append(template[offset : block_match.start()])
+
         # Self-closing block tag without default content
-        if (endblock_match := _find_endblock(template, block_name)) is None:
-            replacement = replacements.get(block_name, "")
+        if (
+            endblock_span := _find_endblock(template, block_name, block_match.end())
+        ) is None:
+            template_parts.append(replacements.get(block_name, ""))
 
-            template = (
-                template[: block_match.start()]
-                + replacement
-                + template[block_match.end() :]
-            )
+            offset = block_match.end()
 
         # Block with default content
         else:
-            block_content = template[block_match.end() : endblock_match.start()]
+            endblock_start, endblock_end = endblock_span
+            block_content = template[block_match.end() : endblock_start]
 
             # Check for unsupported nested blocks
             if (nested_block_match := _find_block(block_content)) is not None:
@@ -426,101 +568,374 @@ def _replace_blocks_with_replacements(template: str, replacements: "dict[str, st
 
             # No replacement for this block, use default content
             if block_name not in replacements:
-                template = (
-                    template[: block_match.start()]
-                    + block_content
-                    + template[endblock_match.end() :]
-                )
+                template_parts.append(block_content)
 
             # Replace default content with replacement
             else:
-                replacement = replacements[block_name].replace(
-                    r"{{ block.super }}", block_content
+                template_parts.append(
+                    replacements[block_name].replace(
+                        r"{{ block.super }}", block_content
+                    )
                 )
 
-                template = (
-                    template[: block_match.start()]
-                    + replacement
-                    + template[endblock_match.end() :]
-                )
+            offset = endblock_end
 
-    return template
+    template_parts.append(template[offset:])
 
+    return "".join(template_parts)
 
-def _remove_comments(
+
+def _remove_matched_comments(
     template: str,
+    find_comment: "Callable[[str, int], re.Match]",
     *,
     trim_blocks: bool = True,
     lstrip_blocks: bool = True,
 ):
-    def _remove_matched_comment(template: str, comment_match: re.Match):
-        text_before_comment = template[: comment_match.start()]
-        text_after_comment = template[comment_match.end() :]
+    template_parts: "list[str]" = []
+    offset = 0
 
-        if text_before_comment:
-            if lstrip_blocks:
-                if _token_is_on_own_line(text_before_comment):
-                    text_before_comment = text_before_comment.rstrip(" ")
+    while (comment_match := find_comment(template, offset)) is not None:
+        text_before_comment = template[offset : comment_match.start()]
 
-        if text_after_comment:
-            if trim_blocks:
-                if text_after_comment.startswith("\n"):
-                    text_after_comment = text_after_comment[1:]
+        if lstrip_blocks:
+            # Spaces before the comment can continue from before the previous comments
+            while template_parts and not text_before_comment.strip(" "):
+                text_before_comment = template_parts.pop() + text_before_comment
 
-        return text_before_comment + text_after_comment
+            if _token_is_on_own_line(text_before_comment):
+                text_before_comment = text_before_comment.rstrip(" ")
 
-    # Remove hash comments: {# ... #}
-    while (comment_match := _find_hash_comment(template)) is not None:
-        template = _remove_matched_comment(template, comment_match)
+        template_parts.append(text_before_comment)
+        offset = comment_match.end()
 
-    # Remove block comments: {% comment %} ... {% endcomment %}
-    while (comment_match := _find_block_comment(template)) is not None:
-        template = _remove_matched_comment(template, comment_match)
+        if trim_blocks:
+            if template.startswith("\n", offset):
+                offset += 1
 
-    return template
+    template_parts.append(template[offset:])
+
+    return "".join(template_parts)
 
 
-def _create_template_rendering_function(  # pylint: disable=,too-many-locals,too-many-branches,too-many-statements
+def _remove_comments(
     template: str,
     *,
     trim_blocks: bool = True,
     lstrip_blocks: bool = True,
-    function_name: str = "__template_rendering_function",
-    context_name: str = "context",
-) -> "Generator[str]":
-    # Resolve includes, blocks and extends
-    template = _resolve_includes_blocks_and_extends(template)
+):
+    # Remove hash comments: {# ... #}
+    if "{# " in template:
+        template = _remove_matched_comments(
+            template,
+            _find_hash_comment,
+            trim_blocks=trim_blocks,
+            lstrip_blocks=lstrip_blocks,
+        )
 
-    # Remove comments
-    template = _remove_comments(template)
+    # Remove block comments: {% comment %} ... {% endcomment %}
+    if "{% comment " in template:
+        template = _remove_matched_comments(
+            template,
+            _find_block_comment,
+            trim_blocks=trim_blocks,
+            lstrip_blocks=lstrip_blocks,
+        )
+
+    return template
+
+
+class _TemplateRenderingFunctionBuilder:
+    """Stores the body of a template rendering function and the state of the template."""
+
+    def __init__(self):
+        # Lines of code and (indentation, expressions) tuples for lines that output expressions
+        self.function_body: "list[str | tuple[str, list[str]]]" = []
+        self.indentation = "    "
+        self.contains_output = False
+
+        # Code from {% exec ... %} that might return from or yield in the rendering function
+        self.contains_return_or_yield = False
+
+        # Outputs are merged until a line of code is added or the indentation changes
+        self._pending_text = ""
+        self._pending_outputs: "list[str]" = []
+        self._block_is_empty = False
+
+        # Keep track of the template state
+        self.nested_if_statements: "list[Token]" = []
+        self.nested_for_loops: "list[Token]" = []
+        self.nested_while_loops: "list[Token]" = []
+        self.nested_autoescape_modes: "list[Token]" = []
+
+    def _flush_pending_text(self) -> None:
+        if self._pending_text:
+            self._pending_outputs.append(repr(self._pending_text))
+            self._pending_text = ""
+
+    def _flush_pending_outputs(self) -> None:
+        self._flush_pending_text()
+
+        if self._pending_outputs:
+            self.function_body.append((self.indentation, self._pending_outputs))
+            self._pending_outputs = []
+            self.contains_output = True
+            self._block_is_empty = False
+
+    def add_line(self, fragment: str) -> None:
+        """Adds a line of code at the current indentation level."""
+        self._flush_pending_outputs()
+        self.function_body.append(self.indentation + fragment)
+
+        # Blank lines and comments do not count as code in the block
+        if (code := fragment.strip()) and not code.startswith("#"):
+            self._block_is_empty = False
+
+    def add_text(self, text: str) -> None:
+        """Adds ``text`` to the output, merged with any directly preceding text."""
+        self._pending_text += text
+
+    def add_output(self, expression: str) -> None:
+        """Adds the result of ``expression`` to the output."""
+        self._flush_pending_text()
+        self._pending_outputs.append(f"({expression})")
+
+    def indent(self) -> None:
+        """Increases the indentation level."""
+        self._flush_pending_outputs()
+        self.indentation += "    "
+        self._block_is_empty = True
+
+    def dedent(self) -> None:
+        """Decreases the indentation level."""
+        self._flush_pending_outputs()
+
+        # Block without any code or output would not be valid Python
+        if self._block_is_empty:
+            self.function_body.append(self.indentation + "pass")
+
+        self.indentation = self.indentation[:-4]
+        self._block_is_empty = False
+
+    def _output_as_expression(self) -> str:
+        if not self.function_body:
+            return '""'
+
+        _, expressions = self.function_body[0]
+
+        # Static text is stored as a string literal, expressions are wrapped in parentheses
+        if len(expressions) == 1 and not expressions[0].startswith("("):
+            return expressions[0]
+
+        return f'"".join(({", ".join(expressions)},))'
+
+    def function_def(
+        self, function_name: str, context_name: str, *, as_generator: bool
+    ) -> str:
+        """
+        Returns the definition of a function that either yields the output or collects it
+        and returns it as a single string.
+        """
+        self._flush_pending_outputs()
+
+        function_def_parts = [f"def {function_name}({context_name}):\n"]
+
+        # Templates without statements have at most one output line, that can be returned directly
+        if not as_generator and not any(
+            isinstance(line, str) for line in self.function_body
+        ):
+            function_def_parts.append(f"    return {self._output_as_expression()}\n")
+            return "".join(function_def_parts)
+
+        if as_generator:
+            single_output_line = "{}yield {}\n"
+            multiple_outputs_line = '{}yield "".join(({},))\n'
+        else:
+            single_output_line = "{}__append({})\n"
+            multiple_outputs_line = "{}__extend(({},))\n"
+            function_def_parts.append("    __output = []\n")
+            function_def_parts.append("    __append = __output.append\n")
+            function_def_parts.append("    __extend = __output.extend\n")
+
+        for line in self.function_body:
+            if isinstance(line, str):
+                function_def_parts.append(line + "\n")
+                continue
+
+            indentation, expressions = line
+            if len(expressions) == 1:
+                function_def_parts.append(
+                    single_output_line.format(indentation, expressions[0])
+                )
+            else:
+                function_def_parts.append(
+                    multiple_outputs_line.format(indentation, ", ".join(expressions))
+                )
+
+        if not as_generator:
+            function_def_parts.append('    return "".join(__output)\n')
 
-    # Create definition of the template function
-    function_def = f"def {function_name}({context_name}):\n"
-    indent_level = 1
+        # Make sure the function definition contains at least one yield statement
+        elif not self.contains_output:
+            function_def_parts.append('    yield ""\n')
 
-    def indented(fragment: str, end: str = "\n") -> str:
-        nonlocal indent_level
-        return "    " * indent_level + fragment + end
+        return "".join(function_def_parts)
+
+
+def _handle_if(builder: _TemplateRenderingFunctionBuilder, token: Token) -> None:
+    builder.add_line(f"if {token.body[3:]}:")
+    builder.indent()
+
+    builder.nested_if_statements.append(token)
+
+
+def _handle_elif(builder: _TemplateRenderingFunctionBuilder, token: Token) -> None:
+    if not builder.nested_if_statements:
+        raise TemplateSyntaxError(token, "No matching {% if ... %}")
+
+    builder.dedent()
+    builder.add_line(f"elif {token.body[5:]}:")
+    builder.indent()
+
+
+def _handle_else(builder: _TemplateRenderingFunctionBuilder, token: Token) -> None:
+    if not builder.nested_if_statements:
+        raise TemplateSyntaxError(token, "No matching {% if ... %}")
+
+    builder.dedent()
+    builder.add_line("else:")
+    builder.indent()
+
+
+def _handle_endif(builder: _TemplateRenderingFunctionBuilder, token: Token) -> None:
+    if not builder.nested_if_statements:
+        raise TemplateSyntaxError(token, "No matching {% if ... %}")
+
+    builder.dedent()
+    builder.nested_if_statements.pop()
+
+
+def _handle_for(builder: _TemplateRenderingFunctionBuilder, token: Token) -> None:
+    builder.add_line(f"for {token.body[4:]}:")
+    builder.indent()
+
+    builder.nested_for_loops.append(token)
+
+
+def _handle_empty(builder: _TemplateRenderingFunctionBuilder, token: Token) -> None:
+    if not builder.nested_for_loops:
+        raise TemplateSyntaxError(token, "No matching {% for ... %}")
+
+    last_forloop_iterable = builder.nested_for_loops[-1].body.split(" in ", 1)[1]
+
+    builder.dedent()
+    builder.add_line(f"if not {last_forloop_iterable}:")
+    builder.indent()
+
+
+def _handle_endfor(builder: _TemplateRenderingFunctionBuilder, token: Token) -> None:
+    if not builder.nested_for_loops:
+        raise TemplateSyntaxError(token, "No matching {% for ... %}")
+
+    builder.dedent()
+    builder.nested_for_loops.pop()
+
+
+def _handle_while(builder: _TemplateRenderingFunctionBuilder, token: Token) -> None:
+    builder.add_line(f"while {token.body[6:]}:")
+    builder.indent()
+
+    builder.nested_while_loops.append(token)
+
+
+def _handle_endwhile(builder: _TemplateRenderingFunctionBuilder, token: Token) -> None:
+    if not builder.nested_while_loops:
+        raise TemplateSyntaxError(token, "No matching {% while ... %}")
+
+    builder.dedent()
+    builder.nested_while_loops.pop()
+
+
+def _handle_exec(builder: _TemplateRenderingFunctionBuilder, token: Token) -> None:
+    code = token.body[5:]
+
+    if "return" in code or "yield" in code:
+        builder.contains_return_or_yield = True
+
+    builder.add_line(code)
+
+
+def _handle_autoescape(
+    builder: _TemplateRenderingFunctionBuilder, token: Token
+) -> None:
+    mode = token.body[11:]
+    if mode not in ("on", "off"):
+        raise ValueError(f"Unknown autoescape mode: {mode}")
+
+    builder.nested_autoescape_modes.append(token)
+
+
+def _handle_endautoescape(
+    builder: _TemplateRenderingFunctionBuilder, token: Token
+) -> None:
+    if not builder.nested_autoescape_modes:
+        raise TemplateSyntaxError(token, "No matching {% autoescape ... %}")
+
+    builder.nested_autoescape_modes.pop()
+
+
+def _handle_endblock(_: _TemplateRenderingFunctionBuilder, token: Token) -> None:
+    # Token is a endblock in top-level template
+    raise TemplateSyntaxError(token, "No matching {% block ... %}")
+
+
+def _handle_extends(_: _TemplateRenderingFunctionBuilder, token: Token) -> None:
+    # Token is a extends in top-level template
+    raise TemplateSyntaxError(token, "Incorrect use of {% extends ... %}")
+
+
+# Statements that consist only of a keyword, matched by the whole token
+_EXACT_STATEMENT_HANDLERS = {
+    r"{% else %}": _handle_else,
+    r"{% endif %}": _handle_endif,
+    r"{% empty %}": _handle_empty,
+    r"{% endfor %}": _handle_endfor,
+    r"{% endwhile %}": _handle_endwhile,
+    r"{% endautoescape %}": _handle_endautoescape,
+}
+
+# Statements followed by an argument, matched by the keyword after {%
+_STATEMENT_HANDLERS = {
+    "if": _handle_if,
+    "elif": _handle_elif,
+    "for": _handle_for,
+    "while": _handle_while,
+    "exec": _handle_exec,
+    "autoescape": _handle_autoescape,
+    "endblock": _handle_endblock,
+    "extends": _handle_extends,
+}
+
+
+def _create_template_rendering_function_builder(  # pylint: disable=,too-many-locals,too-many-branches,too-many-statements
+    template: str,
+    *,
+    trim_blocks: bool = True,
+    lstrip_blocks: bool = True,
+) -> _TemplateRenderingFunctionBuilder:
+    # Create body of the template functions
+    builder = _TemplateRenderingFunctionBuilder()
 
-    # Keep track of the template state
-    nested_if_statements: "list[Token]" = []
-    nested_for_loops: "list[Token]" = []
-    nested_while_loops: "list[Token]" = []
-    nested_autoescape_modes: "list[Token]" = []
     last_token_was_block = False
     offset = 0
 
     # Resolve tokens
-    while (token_match := _find_token(template[offset:])) is not None:
-        token = Token(
-            template,
-            offset + token_match.start(),
-            offset + token_match.end(),
-        )
+    while (token_match := _find_token(template, offset)) is not None:
+        token = Token(template, token_match.start(), token_match.end())
 
         # Add the text before the token
-        if text_before_token := template[offset : offset + token_match.start()]:
-            if lstrip_blocks and token.content.startswith(r"{% "):
+        if text_before_token := template[offset : token_match.start()]:
+            if lstrip_blocks and token.is_statement:
                 if _token_is_on_own_line(text_before_token):
                     text_before_token = text_before_token.rstrip(" ")
 
@@ -529,140 +944,54 @@ def _create_template_rendering_function(  # pylint: disable=,too-many-locals,too
                     text_before_token = text_before_token[1:]
 
         if text_before_token:
-            function_def += indented(f"yield {repr(text_before_token)}")
-        else:
-            function_def += indented("pass")
+            builder.add_text(text_before_token)
 
         # Token is an expression
-        if token.content.startswith(r"{{ "):
+        if token.is_expression:
             last_token_was_block = False
 
-            if nested_autoescape_modes:
-                autoescape = nested_autoescape_modes[-1].content[14:-3] == "on"
+            if builder.nested_autoescape_modes:
+                autoescape = builder.nested_autoescape_modes[-1].body[11:] == "on"
             else:
                 autoescape = True
 
             # Expression should be escaped
             if autoescape:
-                function_def += indented(f"yield safe_html({token.content[3:-3]})")
+                builder.add_output(_SAFE_HTML_EXPRESSION.format(token.body))
             # Expression should not be escaped
             else:
-                function_def += indented(f"yield {token.content[3:-3]}")
+                builder.add_output(token.body)
 
         # Token is a statement
-        elif token.content.startswith(r"{% "):
+        elif token.is_statement:
             last_token_was_block = True
 
-            # Token is a some sort of if statement
-            if token.content.startswith(r"{% if "):
-                function_def += indented(f"if {token.content[6:-3]}:")
-                indent_level += 1
-
-                nested_if_statements.append(token)
-            elif token.content.startswith(r"{% elif "):
-                if not nested_if_statements:
-                    raise TemplateSyntaxError(token, "No matching {% if ... %}")
-
-                indent_level -= 1
-                function_def += indented(f"elif {token.content[8:-3]}:")
-                indent_level += 1
-            elif token.content == r"{% else %}":
-                if not nested_if_statements:
-                    raise TemplateSyntaxError(token, "No matching {% if ... %}")
-
-                indent_level -= 1
-                function_def += indented("else:")
-                indent_level += 1
-            elif token.content == r"{% endif %}":
-                if not nested_if_statements:
-                    raise TemplateSyntaxError(token, "No matching {% if ... %}")
-
-                indent_level -= 1
-                nested_if_statements.pop()
-
-            # Token is a for loop
-            elif token.content.startswith(r"{% for "):
-                function_def += indented(f"for {token.content[7:-3]}:")
-                indent_level += 1
-
-                nested_for_loops.append(token)
-            elif token.content == r"{% empty %}":
-                if not nested_for_loops:
-                    raise TemplateSyntaxError(token, "No matching {% for ... %}")
-
-                last_forloop_iterable = (
-                    nested_for_loops[-1].content[3:-3].split(" in ", 1)[1]
-                )
-
-                indent_level -= 1
-                function_def += indented(f"if not {last_forloop_iterable}:")
-                indent_level += 1
-            elif token.content == r"{% endfor %}":
-                if not nested_for_loops:
-                    raise TemplateSyntaxError(token, "No matching {% for ... %}")
-
-                indent_level -= 1
-                nested_for_loops.pop()
-
-            # Token is a while loop
-            elif token.content.startswith(r"{% while "):
-                function_def += indented(f"while {token.content[9:-3]}:")
-                indent_level += 1
-
-                nested_while_loops.append(token)
-            elif token.content == r"{% endwhile %}":
-                if not nested_while_loops:
-                    raise TemplateSyntaxError(token, "No matching {% while ... %}")
-
-                indent_level -= 1
-                nested_while_loops.pop()
+            handler = _EXACT_STATEMENT_HANDLERS.get(
+                token.content
+            ) or _STATEMENT_HANDLERS.get(token.keyword)
 
-            # Token is a Python code
-            elif token.content.startswith(r"{% exec "):
-                function_def += indented(f"{token.content[8:-3]}")
-
-            # Token is a autoescape mode change
-            elif token.content.startswith(r"{% autoescape "):
-                mode = token.content[14:-3]
-                if mode not in ("on", "off"):
-                    raise ValueError(f"Unknown autoescape mode: {mode}")
-
-                nested_autoescape_modes.append(token)
-
-            elif token.content == r"{% endautoescape %}":
-                if not nested_autoescape_modes:
-                    raise TemplateSyntaxError(token, "No matching {% autoescape ... %}")
-
-                nested_autoescape_modes.pop()
-
-            # Token is a endblock in top-level template
-            elif token.content.startswith(r"{% endblock "):
-                raise TemplateSyntaxError(token, "No matching {% block ... %}")
-
-            # Token is a extends in top-level template
-            elif token.content.startswith(r"{% extends "):
-                raise TemplateSyntaxError(token, "Incorrect use of {% extends ... %}")
-
-            else:
+            if handler is None:
                 raise TemplateSyntaxError(token, f"Unknown token: {token.content}")
 
+            handler(builder, token)
+
         else:
             raise TemplateSyntaxError(token, f"Unknown token: {token.content}")
 
         # Move offset to the end of the token
-        offset += token_match.end()
+        offset = token_match.end()
 
     # Checking for unclosed blocks
-    if len(nested_if_statements) > 0:
-        last_if_statement = nested_if_statements[-1]
+    if len(builder.nested_if_statements) > 0:
+        last_if_statement = builder.nested_if_statements[-1]
         raise TemplateSyntaxError(last_if_statement, "No matching {% endif %}")
 
-    if len(nested_for_loops) > 0:
-        last_for_loop = nested_for_loops[-1]
+    if len(builder.nested_for_loops) > 0:
+        last_for_loop = builder.nested_for_loops[-1]
         raise TemplateSyntaxError(last_for_loop, "No matching {% endfor %}")
 
-    if len(nested_while_loops) > 0:
-        last_while_loop = nested_while_loops[-1]
+    if len(builder.nested_while_loops) > 0:
+        last_while_loop = builder.nested_while_loops[-1]
         raise TemplateSyntaxError(last_while_loop, "No matching {% endwhile %}")
 
     # No check for unclosed autoescape blocks, as they are optional and do not result in errors
@@ -674,15 +1003,81 @@ def _create_template_rendering_function(  # pylint: disable=,too-many-locals,too
         if trim_blocks and text_after_last_token.startswith("\n"):
             text_after_last_token = text_after_last_token[1:]
 
-        function_def += indented(f"yield {repr(text_after_last_token)}")
+        builder.add_text(text_after_last_token)
+
+    return builder
+
+
+# Compiled code of recently created templates, keyed by the resolved template and the options.
+# Every entry keeps a whole template string and its code in memory, so on microcontrollers
+# nothing is saved by default.
+COMPILED_TEMPLATES: "dict[tuple, Any]" = {}
+COMPILED_TEMPLATES_MAXSIZE = 0 if _RUNNING_ON_MICROPYTHON else 32
+
+
+def _create_template_rendering_functions(
+    template: str,
+    *,
+    trim_blocks: bool = True,
+    lstrip_blocks: bool = True,
+    context_name: str = "context",
+    template_files: "dict[str, tuple[int, int]]" = None,
+    cache: bool = True,
+) -> "tuple[Callable[[dict], Generator[str]], Callable[[dict], str]]":
+    # Resolve includes, blocks and extends
+    template = _resolve_includes_blocks_and_extends(template, template_files)
+
+    # Remove comments
+    template = _remove_comments(template)
+
+    # Reuse the compiled function if the same template was already processed
+    key = (template, trim_blocks, lstrip_blocks, context_name)
+    function_code = COMPILED_TEMPLATES.get(key) if cache else None
 
-    # Make sure the function definition contains at least one yield statement
-    if not _contains_any_yield_statement(function_def):
-        function_def += indented('yield ""')
+    if function_code is None:
+        builder = _create_template_rendering_function_builder(
+            template,
+            trim_blocks=trim_blocks,
+            lstrip_blocks=lstrip_blocks,
+        )
 
-    # Create and return the template function
-    exec(function_def)  # pylint: disable=exec-used
-    return locals()[function_name]
+        # Generator for rendering in chunks and a regular function for rendering to a string
+        iter_function_def = builder.function_def(
+            "__template_rendering_iter_function", context_name, as_generator=True
+        )
+
+        # Returning or yielding from {% exec ... %} only works as expected in the generator
+        if builder.contains_return_or_yield:
+            function_def = (
+                f"def __template_rendering_function({context_name}):\n"
+                f'    return "".join(__template_rendering_iter_function({context_name}))\n'
+            )
+        else:
+            function_def = builder.function_def(
+                "__template_rendering_function", context_name, as_generator=False
+            )
+
+        function_code = compile(iter_function_def + function_def, "<template>", "exec")
+
+        if cache:
+            _add_to_limited_cache(
+                COMPILED_TEMPLATES,
+                key,
+                function_code,
+                COMPILED_TEMPLATES_MAXSIZE,
+            )
+
+    # Create and return the template functions, with only the names they use as their globals
+    namespace = {
+        "safe_html": safe_html,
+        "_find_unsafe_html_symbol": _HTML_UNSAFE_SYMBOL_PATTERN.search,
+        "_HTML_TRANSLATION_TABLE": _HTML_TRANSLATION_TABLE,
+    }
+    exec(function_code, namespace)  # pylint: disable=exec-used
+    return (
+        namespace["__template_rendering_iter_function"],
+        namespace["__template_rendering_function"],
+    )
 
 
 def _yield_as_sized_chunks(
@@ -690,21 +1085,32 @@ def _yield_as_sized_chunks(
 ) -> "Generator[str]":
     """Yields resized chunks from the ``generator``."""
 
-    # Yield chunks with a given size
-    chunk = ""
+    # Collect items until there is enough for at least one chunk, then join them only once
+    buffered_items: "list[str]" = []
+    buffered_length = 0
     already_yielded = False
 
     for item in generator:
-        chunk += item
+        buffered_items.append(item)
+        buffered_length += len(item)
 
-        if chunk_size <= len(chunk):
-            yield chunk[:chunk_size]
-            chunk = chunk[chunk_size:]
-            already_yielded = True
+        if buffered_length < chunk_size:
+            continue
+
+        # Yield chunks with a given size, keeping the remainder for the next chunk
+        buffered = "".join(buffered_items)
+        chunks_end = buffered_length - buffered_length % chunk_size
+
+        for chunk_start in range(0, chunks_end, chunk_size):
+            yield buffered[chunk_start : chunk_start + chunk_size]
+
+        buffered_items = [buffered[chunks_end:]]
+        buffered_length -= chunks_end
+        already_yielded = True
 
     # Yield the last chunk
-    if chunk or not already_yielded:
-        yield chunk
+    if (last_chunk := "".join(buffered_items)) or not already_yielded:
+        yield last_chunk
 
 
 class Template:
@@ -712,15 +1118,22 @@ class Template:
     Class that loads a template from ``str`` and allows to rendering it with different contexts.
     """
 
-    _template_function: "Generator[str]"
+    _template_function: "Callable[[dict], Generator[str]]"
+    _template_str_function: "Callable[[dict], str]"
 
-    def __init__(self, template_string: str) -> None:
+    def __init__(self, template_string: str, *, cache: bool = True) -> None:
         """
         Creates a reusable template from the given template string.
 
         :param str template_string: String containing the template to be rendered
+        :param bool cache: When ``True``, the compiled template is saved in ``COMPILED_TEMPLATES``
+            and reused by templates with the same contents. Up to ``COMPILED_TEMPLATES_MAXSIZE``
+            compiled templates are saved, by default none on CircuitPython.
         """
-        self._template_function = _create_template_rendering_function(template_string)
+        (
+            self._template_function,
+            self._template_str_function,
+        ) = _create_template_rendering_functions(template_string, cache=cache)
 
     def render_iter(
         self, context: dict = None, *, chunk_size: int = None
@@ -738,7 +1151,7 @@ class Template:
             template = ... # r"Hello {{ name }}!"
 
             list(template.render_iter({"name": "World"}))
-            # ['Hello ', 'World', '!']
+            # ['Hello World!']
 
             list(template.render_iter({"name": "CircuitPython"}, chunk_size=3))
             # ['Hel', 'lo ', 'Cir', 'cui', 'tPy', 'tho', 'n!']
@@ -762,7 +1175,7 @@ class Template:
             template.render({"name": "World"})
             # 'Hello World!'
         """
-        return "".join(self.render_iter(context or {}))
+        return self._template_str_function(context or {})
 
 
 class FileTemplate(Template):
@@ -770,22 +1183,60 @@ class FileTemplate(Template):
     Class that loads a template from a file and allows to rendering it with different contexts.
     """
 
-    def __init__(self, template_path: str) -> None:
+    def __init__(  # pylint: disable=super-init-not-called
+        self, template_path: str, *, cache: bool = True
+    ) -> None:
         """
         Loads a file and creates a reusable template from its contents.
 
         :param str template_path: Path to a file containing the template to be rendered
+        :param bool cache: When ``True``, the compiled template is saved in ``COMPILED_TEMPLATES``
+            and reused by templates with the same contents. Up to ``COMPILED_TEMPLATES_MAXSIZE``
+            compiled templates are saved, by default none on CircuitPython.
         """
 
-        if not _exists_and_is_file(template_path):
-            raise TemplateNotFoundError(template_path)
+        # Size and modification time of the file and the files it includes or extends
+        self._template_files: "dict[str, tuple[int, int]]" = {}
+
+        (
+            self._template_function,
+            self._template_str_function,
+        ) = _create_template_rendering_functions(
+            _read_template_file(template_path, self._template_files),
+            template_files=self._template_files,
+            cache=cache,
+        )
+
 
-        with open(template_path, "rt", encoding="utf-8") as template_file:
-            template_string = template_file.read()
-        super().__init__(template_string)
+CACHED_TEMPLATES: "OrderedDict[tuple[type, str], Template | FileTemplate]" = (
+    OrderedDict()
+)
+CACHED_TEMPLATES_MAXSIZE = 128
 
 
-CACHED_TEMPLATES: "dict[int, Template| FileTemplate]" = {}
+def _get_template(
+    template_class: type, source: str, cache: bool, stat_check: bool = False
+) -> Template:
+    if not cache:
+        return template_class(source, cache=False)
+
+    # Key by the template string or path itself, not its hash, which can collide
+    key = (template_class, source)
+
+    # Reinsert the template to mark it as most recently used, unless its files have changed
+    if (template := CACHED_TEMPLATES.pop(key, None)) is not None and not (
+        stat_check
+        and _template_files_changed(
+            template._template_files  # pylint: disable=protected-access
+        )
+    ):
+        CACHED_TEMPLATES[key] = template
+        return template
+
+    template = template_class(source)
+    _add_to_limited_cache(CACHED_TEMPLATES, key, template, CACHED_TEMPLATES_MAXSIZE)
+
+    return template
 
 
 def render_string_iter(
@@ -800,7 +1251,8 @@ def render_string_iter(
     ``context``. Returns a generator that yields the rendered output.
 
     If ``cache`` is ``True``, the template is saved and reused on next calls, even with different
-    contexts.
+    contexts. Up to ``CACHED_TEMPLATES_MAXSIZE`` templates are saved, the least recently used ones
+    are removed first.
 
     :param dict context: Dictionary containing the context for the template
     :param int chunk_size: Size of the chunks to be yielded. If ``None``, the generator yields
@@ -810,22 +1262,14 @@ def render_string_iter(
     Example::
 
         list(render_string_iter(r"Hello {{ name }}!", {"name": "World"}))
-        # ['Hello ', 'World', '!']
+        # ['Hello World!']
 
         list(render_string_iter(r"Hello {{ name }}!", {"name": "CircuitPython"}, chunk_size=3))
         # ['Hel', 'lo ', 'Cir', 'cui', 'tPy', 'tho', 'n!']
     """
-    key = hash(template_string)
-
-    if cache and key in CACHED_TEMPLATES:
-        return CACHED_TEMPLATES[key].render_iter(context or {}, chunk_size=chunk_size)
-
-    template = Template(template_string)
-
-    if cache:
-        CACHED_TEMPLATES[key] = template
-
-    return template.render_iter(context or {}, chunk_size=chunk_size)
+    return _get_template(Template, template_string, cache).render_iter(
+        context or {}, chunk_size=chunk_size
+    )
 
 
 def render_string(
@@ -839,7 +1283,8 @@ def render_string(
     ``context``. Returns the rendered output as a string.
 
     If ``cache`` is ``True``, the template is saved and reused on next calls, even with different
-    contexts.
+    contexts. Up to ``CACHED_TEMPLATES_MAXSIZE`` templates are saved, the least recently used ones
+    are removed first.
 
     :param dict context: Dictionary containing the context for the template
     :param bool cache: When ``True``, the template is saved and reused on next calls.
@@ -849,17 +1294,7 @@ def render_string(
         render_string(r"Hello {{ name }}!", {"name": "World"})
         # 'Hello World!'
     """
-    key = hash(template_string)
-
-    if cache and key in CACHED_TEMPLATES:
-        return CACHED_TEMPLATES[key].render(context or {})
-
-    template = Template(template_string)
-
-    if cache:
-        CACHED_TEMPLATES[key] = template
-
-    return template.render(context or {})
+    return _get_template(Template, template_string, cache).render(context or {})
 
 
 def render_template_iter(
@@ -868,38 +1303,34 @@ def render_template_iter(
     *,
     chunk_size: int = None,
     cache: bool = True,
+    stat_check: bool = True,
 ):
     """
     Creates a `FileTemplate` from the given ``template_path`` and renders it using the provided
     ``context``. Returns a generator that yields the rendered output.
 
     If ``cache`` is ``True``, the template is saved and reused on next calls, even with different
-    contexts.
+    contexts. Up to ``CACHED_TEMPLATES_MAXSIZE`` templates are saved, the least recently used ones
+    are removed first.
 
     :param dict context: Dictionary containing the context for the template
     :param int chunk_size: Size of the chunks to be yielded. If ``None``, the generator yields
         the template in chunks sized specifically for the given template
     :param bool cache: When ``True``, the template is saved and reused on next calls.
+    :param bool stat_check: When ``True``, a saved template is created again if its file, or any
+        file it includes or extends, has changed since it was saved.
 
     Example::
 
         list(render_template_iter(..., {"name": "World"})) # r"Hello {{ name }}!"
-        # ['Hello ', 'World', '!']
+        # ['Hello World!']
 
         list(render_template_iter(..., {"name": "CircuitPython"}, chunk_size=3))
         # ['Hel', 'lo ', 'Cir', 'cui', 'tPy', 'tho', 'n!']
     """
-    key = hash(template_path)
-
-    if cache and key in CACHED_TEMPLATES:
-        return CACHED_TEMPLATES[key].render_iter(context or {}, chunk_size=chunk_size)
-
-    template = FileTemplate(template_path)
-
-    if cache:
-        CACHED_TEMPLATES[key] = template
-
-    return template.render_iter(context or {}, chunk_size=chunk_size)
+    return _get_template(FileTemplate, template_path, cache, stat_check).render_iter(
+        context or {}, chunk_size=chunk_size
+    )
 
 
 def render_template(
@@ -907,31 +1338,26 @@ def render_template(
     context: dict = None,
     *,
     cache: bool = True,
+    stat_check: bool = True,
 ):
     """
     Creates a `FileTemplate` from the given ``template_path`` and renders it using the provided
     ``context``. Returns the rendered output as a string.
 
     If ``cache`` is ``True``, the template is saved and reused on next calls, even with different
-    contexts.
+    contexts. Up to ``CACHED_TEMPLATES_MAXSIZE`` templates are saved, the least recently used ones
+    are removed first.
 
     :param dict context: Dictionary containing the context for the template
     :param bool cache: When ``True``, the template is saved and reused on next calls.
+    :param bool stat_check: When ``True``, a saved template is created again if its file, or any
+        file it includes or extends, has changed since it was saved.
 
     Example::
 
         render_template(..., {"name": "World"}) # r"Hello {{ name }}!"
         # 'Hello World!'
     """
-
-    key = hash(template_path)
-
-    if cache and key in CACHED_TEMPLATES:
-        return CACHED_TEMPLATES[key].render(context or {})
-
-    template = FileTemplate(template_path)
-
-    if cache:
-        CACHED_TEMPLATES[key] = template
-
-    return template.render(context or {})
+    return _get_template(FileTemplate, template_path, cache, stat_check).render(
+        context or {}
+    )